@@ -0,0 +1,289 @@
+import html
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import re
+import time
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from models import db, DocumentAnalysis, ReferenceStyle
+
+logger = logging.getLogger(__name__)
+
+# Double-spaced, 12pt academic page
+WORDS_PER_PAGE = 275
+
+# Analyses claimed by a pipeline that died before finishing are picked up again
+CLAIM_LEASE = timedelta(minutes=15)
+
+# Weighted patterns; the style with the highest score wins
+CITATION_PATTERNS = {
+    # (Smith, 2020) / (Smith & Jones, 2020, p. 4)
+    ReferenceStyle.APA: [
+        (re.compile(r"\([A-Z][\w'-]+(?: et al\.| (?:&|and) [A-Z][\w'-]+)?, (?:1[5-9]|20)\d{2}[a-z]?(?:, pp?\. ?\d+(?:[-–]\d+)?)?\)"), 1),
+        (re.compile(r"^\s*References\s*$", re.MULTILINE), 2),
+    ],
+    # (Smith 2020) / (Smith 2020, p. 4)
+    ReferenceStyle.HARVARD: [
+        (re.compile(r"\([A-Z][\w'-]+(?: et al\.| (?:&|and) [A-Z][\w'-]+)? (?:1[5-9]|20)\d{2}[a-z]?(?:[,:] ?pp?\. ?\d+(?:[-–]\d+)?)?\)"), 1),
+        (re.compile(r"^\s*Reference List\s*$", re.MULTILINE), 2),
+    ],
+    # (Smith 45) / (Smith and Jones 45-47)
+    ReferenceStyle.MLA: [
+        (re.compile(r"\([A-Z][\w'-]+(?: et al\.| (?:and) [A-Z][\w'-]+)? \d{1,3}(?:[-–]\d{1,3})?\)"), 1),
+        (re.compile(r"^\s*Works Cited\s*$", re.MULTILINE), 2),
+    ],
+    # Footnotes: "1. Jane Smith, Title (City: Publisher, 2020), 45." and "Ibid."
+    ReferenceStyle.CHICAGO: [
+        (re.compile(r"\bIbid\.?"), 1),
+        (re.compile(r"^\s*\d+\.\s+[A-Z][^\n]*\(\w[^\n]*\d{4}\),\s*\d+\.\s*$", re.MULTILINE), 1),
+        (re.compile(r"^\s*Bibliography\s*$", re.MULTILINE), 2),
+    ],
+}
+
+
+def _xml_text(xml, paragraph_pattern):
+    xml = re.sub(paragraph_pattern, lambda match: '\n' + match.group(0), xml)
+    return html.unescape(re.sub(r'<[^>]+>', '', xml))
+
+
+def _extract_docx(path):
+    with zipfile.ZipFile(path) as archive:
+        parts = ['word/document.xml', 'word/footnotes.xml', 'word/endnotes.xml']
+        names = set(archive.namelist())
+        return '\n'.join(
+            _xml_text(archive.read(part).decode('utf-8'), r'<w:p[ >]')
+            for part in parts if part in names
+        )
+
+
+def _extract_odt(path):
+    with zipfile.ZipFile(path) as archive:
+        return _xml_text(archive.read('content.xml').decode('utf-8'), r'<text:[ph][ >]')
+
+
+def _extract_pdf(path):
+    """Best-effort text from Tj/TJ operators in (optionally Flate-compressed) content streams."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    lines = []
+    for match in re.finditer(rb'stream\r?\n(.*?)\r?\nendstream', data, re.DOTALL):
+        stream = match.group(1)
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for text_object in re.findall(rb'BT(.*?)ET', stream, re.DOTALL):
+            strings = re.findall(rb'\(((?:\\.|[^\\)])*)\)', text_object)
+            lines.append(b''.join(strings).decode('latin-1'))
+    return '\n'.join(lines)
+
+
+def _extract_plain(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+EXTRACTORS = {
+    '.txt': _extract_plain,
+    '.md': _extract_plain,
+    '.docx': _extract_docx,
+    '.odt': _extract_odt,
+    '.pdf': _extract_pdf,
+}
+
+
+def extract_text(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Unsupported file type '{extension}'. Supported: {sorted(EXTRACTORS)}")
+    return EXTRACTORS[extension](path)
+
+
+def detect_citation_style(text):
+    """Returns the most likely reference style, or None if no citations are found."""
+    scores = {
+        style: sum(weight * len(pattern.findall(text)) for pattern, weight in patterns)
+        for style, patterns in CITATION_PATTERNS.items()
+    }
+    style, score = max(scores.items(), key=lambda item: item[1])
+    return style if score > 0 else None
+
+
+# Percent complete reported after each stage; the parent writes 100 once results are stored
+PROGRESS_STARTED = 5
+PROGRESS_EXTRACTED = 60
+PROGRESS_COUNTED = 70
+PROGRESS_DETECTED = 95
+
+# Set in each pool process by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _report(analysis_id, progress):
+    if _progress_queue is not None and analysis_id is not None:
+        _progress_queue.put((analysis_id, progress))
+
+
+def analyze_document(path, analysis_id=None):
+    """Runs in a pool process: extract the text and compute the metrics."""
+    _report(analysis_id, PROGRESS_STARTED)
+    text = extract_text(path)
+    _report(analysis_id, PROGRESS_EXTRACTED)
+    word_count = len(text.split())
+    _report(analysis_id, PROGRESS_COUNTED)
+    citation_style = detect_citation_style(text)
+    _report(analysis_id, PROGRESS_DETECTED)
+    return {
+        'word_count': word_count,
+        'page_estimate': math.ceil(word_count / WORDS_PER_PAGE),
+        'citation_style': citation_style,
+    }
+
+
+def claim_analyses(limit):
+    """Atomically mark up to limit queued analyses as ours and return them."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = or_(
+        DocumentAnalysis.status == 'pending',
+        and_(DocumentAnalysis.status == 'processing', DocumentAnalysis.claimed_at < now - CLAIM_LEASE),
+    )
+    ids = select(DocumentAnalysis.id).where(due).order_by(DocumentAnalysis.id).limit(limit)
+    db.session.execute(
+        update(DocumentAnalysis)
+        .where(DocumentAnalysis.id.in_(ids.scalar_subquery()), due)
+        .values(status='processing', progress=0, claim_token=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return DocumentAnalysis.query.filter_by(claim_token=token).order_by(DocumentAnalysis.id).all()
+
+
+def record_result(analysis_id, token, future):
+    values = {'progress': 100, 'claim_token': None, 'completed_at': datetime.utcnow()}
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.warning('Analysis %s failed: %s', analysis_id, e)
+        values.update(status='failed', error=str(e))
+    else:
+        values.update(status='completed', error=None, **result)
+    # Only write while the claim is still ours: the row may have been deleted along
+    # with its assignment, or reclaimed by another pipeline after the lease expired
+    updated = db.session.execute(
+        update(DocumentAnalysis)
+        .where(DocumentAnalysis.id == analysis_id, DocumentAnalysis.claim_token == token)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if updated.rowcount == 0:
+        logger.info('Analysis %s is no longer claimed by us; dropping its result', analysis_id)
+        db.session.rollback()
+        return
+    db.session.commit()
+
+
+def apply_progress(progress_queue):
+    """Store the stage updates pool processes have reported since the last call."""
+    latest = {}
+    while True:
+        try:
+            analysis_id, progress = progress_queue.get_nowait()
+        except queue.Empty:
+            break
+        latest[analysis_id] = max(progress, latest.get(analysis_id, 0))
+    for analysis_id, progress in latest.items():
+        db.session.execute(
+            update(DocumentAnalysis)
+            .where(
+                DocumentAnalysis.id == analysis_id,
+                DocumentAnalysis.status == 'processing',
+                DocumentAnalysis.progress < progress,
+            )
+            .values(progress=progress)
+            .execution_options(synchronize_session=False)
+        )
+    if latest:
+        db.session.commit()
+
+
+def _new_pool(max_workers, progress_queue):
+    # Spawned workers never inherit the parent's database connections
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(progress_queue,),
+    )
+
+
+def run_pipeline(app, max_workers=None, poll_interval=1.0):
+    """Feed queued analyses to a process pool and store results as they complete."""
+    max_workers = max_workers or os.cpu_count() or 1
+    progress_queue = multiprocessing.get_context('spawn').Queue()
+    pool = _new_pool(max_workers, progress_queue)
+    in_flight = {}
+    try:
+        while True:
+            with app.app_context():
+                try:
+                    free = max_workers - len(in_flight)
+                    if free > 0:
+                        for analysis in claim_analyses(free):
+                            try:
+                                future = pool.submit(analyze_document, analysis.file_path, analysis.id)
+                            except BrokenProcessPool:
+                                # A worker died (e.g. out of memory); its analyses were already failed
+                                pool.shutdown(wait=False)
+                                pool = _new_pool(max_workers, progress_queue)
+                                future = pool.submit(analyze_document, analysis.file_path, analysis.id)
+                            in_flight[future] = (analysis.id, analysis.claim_token)
+
+                    if not in_flight:
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    apply_progress(progress_queue)
+                    for future in done:
+                        analysis_id, token = in_flight.pop(future)
+                        try:
+                            record_result(analysis_id, token, future)
+                        except Exception:
+                            # One bad row must not stop the pipeline; the lease lets it be retried
+                            logger.exception('Failed to record analysis %s', analysis_id)
+                            db.session.rollback()
+                finally:
+                    db.session.remove()
+    finally:
+        # Drop queued work (shutdown(cancel_futures=True) needs Python 3.9); claimed
+        # analyses that never ran are picked up again once their lease expires
+        for future in in_flight:
+            future.cancel()
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app({'MIGRATIONS_ENABLED': False})
+    logging.basicConfig(level=logging.INFO)
+    try:
+        run_pipeline(app, max_workers=app.config['ANALYSIS_WORKERS'])
+    except KeyboardInterrupt:
+        pass
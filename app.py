@@ -1,30 +1,33 @@
-import random
-from flask import Flask, request, jsonify, make_response, session, redirect, url_for, render_template
-from flask_migrate import Migrate
+import os
+import uuid
+from functools import wraps
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, make_response, session, redirect, url_for, render_template, stream_with_context
 from flask_cors import CORS
 from flask_restful import Api, Resource
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.exceptions import NotFound
-from datetime import timedelta, datetime
+from werkzeug.utils import secure_filename
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config["JWT_SECRET_KEY"] = "fsbdgfnhgvjnvhmvh" + str(random.randint(1, 1000000000000))
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=1)
-app.config["SECRET_KEY"] = "JKSRVHJVFBSRDFV" + str(random.randint(1, 1000000000000))
-app.json.compact = False
-api = Api(app)
+from config import Config, instance_secret
+from models import db, User, UserCount, Assignment, Bid, OutboxEvent, InboxMessage, DocumentAnalysis
+from exports import EXPORT_FORMATS, build_export_query, export_supports_dates, stream_export
+from ratelimit import LimiterStore, login_attempt_key, rate_limit
 
-from models import db, User, Assignment, Bid
+USER_PAGE_SIZE = 50
+USER_PAGE_SIZE_MAX = 200
+USER_SEARCH_FIELDS = ('username', 'email')
 
-db.init_app(app)
-jwt = JWTManager(app)
-migrate = Migrate(app, db)
+jwt = JWTManager()
+cors = CORS()
+main = Blueprint('main', __name__)
 
 # Role-based decorator
 def role_required(roles):
     def wrapper(fn):
+        @wraps(fn)
         @jwt_required()
         def decorated_function(*args, **kwargs):
             user_id = get_jwt_identity()['user_id']
@@ -35,8 +38,45 @@ def role_required(roles):
         return decorated_function
     return wrapper
 
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with prefix, or None if there is none.
+
+    SQLite compares TEXT as UTF-8 bytes, which orders the same as code points.
+    """
+    chars = list(prefix)
+    while chars:
+        code = ord(chars.pop()) + 1
+        if 0xD800 <= code <= 0xDFFF:
+            # Surrogates cannot be encoded; skip to the next encodable code point
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return ''.join(chars) + chr(code)
+    return None
+
+def user_listing_query(after=0, role=None, search_field=None, prefix=None):
+    """Keyset-paginated admin user listing.
+
+    Without a search the page follows the primary key after the last id seen.
+    A prefix search on username or email pages in that column's order instead,
+    after the last value seen, so SQLite walks the column's unique index and
+    stops at the page limit rather than filtering the whole table by id.
+    """
+    query = User.query
+    if role:
+        query = query.filter(User.role == role)
+    if not search_field:
+        return query.filter(User.id > after).order_by(User.id)
+
+    column = getattr(User, search_field)
+    query = query.filter(column >= prefix)
+    upper = prefix_upper_bound(prefix)
+    if upper is not None:
+        query = query.filter(column < upper)
+    if after:
+        query = query.filter(column > after)
+    return query.order_by(column)
+
 # Error handler
-@app.errorhandler(NotFound)
 def handle_not_found(e):
     response = make_response(
         jsonify({'error': 'NotFound', 'message': 'The requested resource does not exist'}),
@@ -45,14 +85,13 @@ def handle_not_found(e):
     response.headers['Content-Type'] = 'application/json'
     return response
 
-app.register_error_handler(404, handle_not_found)
-
 # Routes and resources
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('index.html')
 
 class UserResource(Resource):
+    @rate_limit('listing')
     @role_required(['admin'])  # Only admin can view all users
     def get(self, user_id=None):
         if user_id:
@@ -60,8 +99,42 @@ class UserResource(Resource):
             if user:
                 return user.to_dict(), 200
             return {'error': 'User not found'}, 404
-        users = User.query.all()
-        return [user.to_dict() for user in users], 200
+
+        try:
+            limit = min(int(request.args.get('limit', USER_PAGE_SIZE)), USER_PAGE_SIZE_MAX)
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        if limit <= 0:
+            return {'error': 'limit must be positive'}, 400
+
+        role = request.args.get('role')
+        search_field = next((field for field in USER_SEARCH_FIELDS if request.args.get(field)), None)
+        after = request.args.get('after')
+        if not search_field:
+            try:
+                after = int(after or 0)
+            except ValueError:
+                return {'error': 'after must be an integer'}, 400
+
+        query = user_listing_query(
+            after=after,
+            role=role,
+            search_field=search_field,
+            prefix=request.args.get(search_field) if search_field else None,
+        )
+        users = query.limit(limit + 1).all()
+
+        has_more = len(users) > limit
+        users = users[:limit]
+        next_cursor = None
+        if has_more:
+            next_cursor = getattr(users[-1], search_field) if search_field else users[-1].id
+        return {
+            'users': [user.to_dict() for user in users],
+            'next_cursor': next_cursor,
+            # Counters are kept per role; a search has no cached total
+            'total': None if search_field else UserCount.total_for(role),
+        }, 200
 
     @jwt_required()  # Only logged-in users can update their own profile
     def patch(self, user_id):
@@ -84,11 +157,13 @@ class UserResource(Resource):
         return {'message': 'User deleted successfully'}, 200
 
 class BiddingResource(Resource):
+    @rate_limit('listing')
     @role_required(['writer'])  # Only writers can bid on assignments
     def get(self):
         bids = Bid.query.all()
         return [bid.to_dict() for bid in bids], 200
 
+    @rate_limit('bids')
     @role_required(['writer'])  # Only writers can post bids
     def post(self):
         user_id = get_jwt_identity()['user_id']
@@ -103,6 +178,18 @@ class BiddingResource(Resource):
 
         bid = Bid(user_id=user_id, assignment_id=assignment_id, amount=amount)
         db.session.add(bid)
+        db.session.flush()
+
+        # Notify the owning client; the event commits atomically with the bid
+        OutboxEvent.enqueue(
+            'bid_placed',
+            assignment.user_id,
+            bid_id=bid.id,
+            assignment_id=assignment.id,
+            assignment_title=assignment.title,
+            amount=bid.amount,
+            writer=bid.user.username,
+        )
         db.session.commit()
 
         return bid.to_dict(), 201
@@ -145,6 +232,7 @@ class AssignmentResource(Resource):
 
         return new_assignment.to_dict(), 201
     
+    @rate_limit('listing')
     @jwt_required()
     def get(self, assignment_id=None):
         if assignment_id:
@@ -179,13 +267,17 @@ class AssignmentResource(Resource):
         pages = request.form.get('pages', assignment.pages)
         reference_style = request.form.get('reference_style', assignment.reference_style)
         due_date = request.form.get('due_date', assignment.due_date)
+        status = request.form.get('status', assignment.status)
+
+        if status not in Assignment.STATUS_OPTIONS:
+            return {"message": f"Invalid status. Must be one of {Assignment.STATUS_OPTIONS}"}, 400
 
         try:
             if price_tag:
                 price_tag = float(price_tag)
             if pages:
                 pages = int(pages)
-            if due_date:
+            if isinstance(due_date, str):
                 due_date = datetime.strptime(due_date, '%Y-%m-%d')
         except ValueError:
             return {"message": "Invalid value for price tag, pages, or due date"}, 400
@@ -197,6 +289,19 @@ class AssignmentResource(Resource):
         assignment.reference_style = reference_style
         assignment.due_date = due_date
 
+        if status != assignment.status:
+            assignment.status = status
+            # Notify every writer still in the running for this assignment
+            writer_ids = {bid.user_id for bid in assignment.bids if bid.status != 'rejected'}
+            for writer_id in writer_ids:
+                OutboxEvent.enqueue(
+                    'assignment_status_changed',
+                    writer_id,
+                    assignment_id=assignment.id,
+                    assignment_title=assignment.title,
+                    status=status,
+                )
+
         db.session.commit()
         return assignment.to_dict(), 200
 
@@ -217,28 +322,64 @@ class AssignmentResource(Resource):
         db.session.commit()
         return {"message": "Assignment deleted successfully"}, 200
 
+@main.route('/assignments/upload/<int:assignment_id>', methods=['POST'])
+@role_required(['writer', 'client'])
+def post_file_upload(assignment_id):
+    assignment = Assignment.query.get(assignment_id)
+    if not assignment:
+        return {"message": "Assignment not found"}, 404
+
+    if assignment.status != 'in_progress':
+        return {"message": "Files can only be uploaded for assignments in progress."}, 400
+
+    if 'file' not in request.files:
+        return {"message": "No file part"}, 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return {"message": "No selected file"}, 400
+
+    filename = secure_filename(file.filename)
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{assignment_id}_{uuid.uuid4().hex}_{filename}")
+    file.save(file_path)
+
+    # Queue the document for the analysis pipeline (python analysis.py)
+    analysis = DocumentAnalysis(assignment_id=assignment_id, filename=filename, file_path=file_path)
+    db.session.add(analysis)
+    db.session.commit()
+
+    return {"message": "File uploaded successfully", "analysis": analysis.to_dict()}, 201
+
+class DocumentAnalysisResource(Resource):
     @jwt_required()
-    @role_required(['writer', 'client'])
-    @app.route('/assignments/upload/<int:assignment_id>', methods=['POST'])  
-    def post_file_upload(self, assignment_id):
+    def get(self, assignment_id, analysis_id=None):
         assignment = Assignment.query.get(assignment_id)
         if not assignment:
             return {"message": "Assignment not found"}, 404
 
-        if assignment.status != 'in_progress':
-            return {"message": "Files can only be uploaded for assignments in progress."}, 400
+        # Only the owning client, writers who bid on the assignment and admins
+        user = User.query.get(get_jwt_identity()['user_id'])
+        allowed = user and (
+            user.role == 'admin'
+            or assignment.user_id == user.id
+            or Bid.query.filter_by(assignment_id=assignment_id, user_id=user.id).first() is not None
+        )
+        if not allowed:
+            return {"message": "You are not authorized to view this assignment's analyses"}, 403
 
-        if 'file' not in request.files:
-            return {"message": "No file part"}, 400
+        if analysis_id:
+            analysis = DocumentAnalysis.query.filter_by(id=analysis_id, assignment_id=assignment_id).first()
+            if not analysis:
+                return {"message": "Analysis not found"}, 404
+            return analysis.to_dict(), 200
 
-        file = request.files['file']
-        if file.filename == '':
-            return {"message": "No selected file"}, 400
-        file_path = f"/path/to/save/{file.filename}"  
-        file.save(file_path)
+        analyses = DocumentAnalysis.query.filter_by(assignment_id=assignment_id).order_by(DocumentAnalysis.id).all()
+        return [analysis.to_dict() for analysis in analyses], 200
 
-        return {"message": "File uploaded successfully"}, 201
 class Login(Resource):
+    # Per-user limiting keys on the client and attempted username to slow password guessing
+    @rate_limit('login', user_key=login_attempt_key)
     def post(self):
         username = request.form.get('username')
         password = request.form.get('password')
@@ -281,6 +422,59 @@ class Register(Resource):
 
         return {'message': 'User registered successfully'}, 201
 
+class ExportResource(Resource):
+    @rate_limit('listing')
+    @role_required(['admin'])  # Only admin can export reporting data
+    def get(self, kind):
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return {"message": f"Invalid format. Must be one of {list(EXPORT_FORMATS)}"}, 400
+
+        try:
+            since = request.args.get('since')
+            until = request.args.get('until')
+            since = datetime.strptime(since, '%Y-%m-%d') if since else None
+            until = datetime.strptime(until, '%Y-%m-%d') if until else None
+        except ValueError:
+            return {"message": "Invalid value for since or until"}, 400
+        if (since or until) and not export_supports_dates(kind):
+            return {"message": f"Date filters are not supported for {kind}"}, 400
+
+        # Users are filtered by role, assignments and bids by status
+        status = request.args.get('role' if kind == 'users' else 'status')
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        stmt = build_export_query(kind, since=since, until=until, status=status)
+        result = db.session.execute(stmt)
+
+        filename = f"{kind}.{fmt}" + ('.gz' if compress else '')
+        response = Response(
+            stream_with_context(stream_export(result, fmt, compress=compress)),
+            mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class InboxResource(Resource):
+    @jwt_required()
+    def get(self):
+        user_id = get_jwt_identity()['user_id']
+        query = InboxMessage.query.filter_by(user_id=user_id)
+        if request.args.get('unread', '').lower() in ('1', 'true', 'yes'):
+            query = query.filter_by(read=False)
+        messages = query.order_by(InboxMessage.id.desc()).limit(50).all()
+        return [message.to_dict() for message in messages], 200
+
+    @jwt_required()
+    def patch(self, message_id):
+        user_id = get_jwt_identity()['user_id']
+        message = InboxMessage.query.filter_by(id=message_id, user_id=user_id).first()
+        if not message:
+            return {"message": "Message not found"}, 404
+        message.read = True
+        db.session.commit()
+        return message.to_dict(), 200
+
 class CheckSession(Resource):
     @jwt_required()
     def get(self):
@@ -298,13 +492,89 @@ class Logout(Resource):
         return jsonify({"message": "Logout successful"})
 
 # Register API endpoints
-api.add_resource(UserResource, '/users', '/users/<int:user_id>')
-api.add_resource(AssignmentResource, '/assignments', '/assignments/<int:assignment_id>', '/assignments/upload/<int:assignment_id>')
-api.add_resource(BiddingResource, '/bids')
-api.add_resource(Login, '/login')
-api.add_resource(Register, '/register')
-api.add_resource(CheckSession, '/session')
-api.add_resource(Logout, '/logout')
+def register_resources(api):
+    api.add_resource(UserResource, '/users', '/users/<int:user_id>')
+    api.add_resource(AssignmentResource, '/assignments', '/assignments/<int:assignment_id>')
+    api.add_resource(DocumentAnalysisResource, '/assignments/<int:assignment_id>/analysis', '/assignments/<int:assignment_id>/analysis/<int:analysis_id>')
+    api.add_resource(BiddingResource, '/bids')
+    api.add_resource(ExportResource, '/export/<any(users, assignments, bids):kind>')
+    api.add_resource(InboxResource, '/inbox', '/inbox/<int:message_id>')
+    api.add_resource(Login, '/login')
+    api.add_resource(Register, '/register')
+    api.add_resource(CheckSession, '/session')
+    api.add_resource(Logout, '/logout')
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    # In WAL mode readers never block writers, so a long streamed export
+    # holding a read transaction does not lock out writes from other workers
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+def create_app(config=None):
+    """Build the application. `config` is a mapping or object overriding Config."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # Stable across processes and restarts, unlike a per-process random value
+    for key, filename in (('SECRET_KEY', 'secret_key'), ('JWT_SECRET_KEY', 'jwt_secret_key')):
+        if not app.config.get(key):
+            app.config[key] = instance_secret(app.instance_path, filename)
+    if not app.config.get('UPLOAD_FOLDER'):
+        app.config['UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'uploads')
+    if not app.config.get('RATELIMIT_STORAGE'):
+        os.makedirs(app.instance_path, exist_ok=True)
+        app.config['RATELIMIT_STORAGE'] = os.path.join(app.instance_path, 'ratelimit.db')
+    app.json.compact = False
+
+    cors.init_app(app, resources={r"/*": {"origins": "*"}})
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _enable_sqlite_wal)
+    jwt.init_app(app)
+    app.extensions['ratelimit'] = LimiterStore(app.config['RATELIMIT_STORAGE'])
+    if app.config['MIGRATIONS_ENABLED']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    app.register_error_handler(NotFound, handle_not_found)
+    app.register_blueprint(main)
+    register_resources(Api(app))
+    return app
+
+def warm_up(app):
+    """Do the lazy first-request work up front so pre-forked workers share it copy-on-write.
+
+    Call in the master process after create_app() and before forking workers.
+    """
+    import gc
+    from sqlalchemy.orm import configure_mappers
+
+    configure_mappers()
+    with app.app_context():
+        # Compile the statements nearly every request runs into the engine's cache
+        try:
+            db.session.get(User, 0)
+            User.query.filter_by(username='').first()
+            UserCount.total_for()
+        except DBAPIError as e:
+            # Typically an unmigrated database; workers still start and fail per request
+            app.logger.warning('Skipping query warm-up, the database is not ready: %s', e.orig)
+        db.session.remove()
+        # Forked workers must not share the master's pooled connections
+        db.engine.dispose()
+    with app.test_request_context('/'):
+        app.jinja_env.get_template('index.html')
+        app.url_map.bind('localhost').match('/users')
+
+    # Objects allocated so far are never collected, so the collector leaves their pages clean
+    gc.collect()
+    gc.freeze()
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
+    create_app().run(port=5000, debug=True)
@@ -0,0 +1,199 @@
+"""Startup time and per-worker memory of the app factory.
+
+    python bench_startup.py [--runs 21] [--workers 4] [--requests 200]
+
+Startup: in a fresh interpreter per run, times separately importing and
+building the app (with and without Flask-Migrate), warm_up() itself, and the
+first request the process serves, with and without warm_up() beforehand.
+Modes are interleaved run by run so drift on the machine hits them equally;
+each phase is reported as median, min-max and standard deviation.
+
+Memory: a master forks N workers that each serve the same requests, either
+after building and warming the app in the master (preload, as wsgi.py does
+under gunicorn) or by building it in every worker. Each worker reports its
+RSS and its USS (pages not shared with any other process) from
+/proc/self/smaps_rollup, so this part needs Linux.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Child interpreters import the app from here, wherever the bench is run from
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# label -> (MIGRATIONS_ENABLED, call warm_up before the first request)
+STARTUP_MODES = {
+    'create_app()': (True, False),
+    'create_app(MIGRATIONS_ENABLED=False)': (False, False),
+    'create_app(MIGRATIONS_ENABLED=False) + warm_up': (False, True),
+}
+PHASES = ('startup', 'warm_up', 'first_request')
+
+
+def _startup_child(migrations, warm):
+    timings = {}
+    start = time.perf_counter()
+    from app import create_app, warm_up
+    app = create_app({'MIGRATIONS_ENABLED': migrations})
+    timings['startup'] = (time.perf_counter() - start) * 1000
+    if warm:
+        start = time.perf_counter()
+        warm_up(app)
+        timings['warm_up'] = (time.perf_counter() - start) * 1000
+    client = app.test_client()
+    start = time.perf_counter()
+    client.post('/login', data={'username': 'nobody', 'password': 'wrong'})
+    timings['first_request'] = (time.perf_counter() - start) * 1000
+    print(json.dumps(timings))
+
+
+def _summary(values):
+    spread = statistics.stdev(values) if len(values) > 1 else 0.0
+    return f'{statistics.median(values):7.1f} ms  [{min(values):6.1f}-{max(values):6.1f}]  sd {spread:5.1f}'
+
+
+def _memory_kb():
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values['Rss'],
+        'uss': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def _build_app():
+    from app import create_app
+    return create_app({'MIGRATIONS_ENABLED': False})
+
+
+def _serve(app, requests, write_fd):
+    from flask_jwt_extended import create_access_token
+    from models import User
+
+    client = app.test_client()
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity={'user_id': admin.id, 'role': 'admin'})}
+    failed = 0
+    for _ in range(requests):
+        failed += client.get('/users?limit=20', headers=headers).status_code != 200
+        client.get('/assignments', headers=headers)
+        client.post('/login', data={'username': 'nobody', 'password': 'wrong'})
+    os.write(write_fd, (json.dumps(dict(_memory_kb(), failed=failed)) + '\n').encode())
+    os._exit(0)
+
+
+def _memory_child(mode, workers, requests):
+    if mode == 'preload':
+        from app import warm_up
+        app = _build_app()
+        warm_up(app)
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            if mode == 'preload':
+                from models import db
+                with app.app_context():
+                    db.engine.dispose(close=False)
+                _serve(app, requests, write_fd)
+            else:
+                _serve(_build_app(), requests, write_fd)
+        pids.append(pid)
+    os.close(write_fd)
+
+    with os.fdopen(read_fd) as reader:
+        results = [json.loads(line) for line in reader]
+    for pid in pids:
+        os.waitpid(pid, 0)
+    print(json.dumps(results))
+
+
+def _setup_database(env):
+    code = (
+        "from app import create_app\n"
+        "from models import db, User\n"
+        "app = create_app({'MIGRATIONS_ENABLED': False})\n"
+        "with app.app_context():\n"
+        "    db.create_all()\n"
+        "    for i in range(500):\n"
+        "        user = User(username=f'user{i}', email=f'user{i}@example.com', role='writer')\n"
+        "        user.set_password('password')\n"
+        "        db.session.add(user)\n"
+        "    admin = User(username='admin', email='admin@example.com', role='admin')\n"
+        "    admin.set_password('password')\n"
+        "    db.session.add(admin)\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', code], env=env, cwd=REPO_DIR, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=21)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            SECRET_KEY='bench-secret',
+            JWT_SECRET_KEY='bench-jwt-secret',
+            # Measure the app itself, not the limiter turning requests away
+            RATELIMIT_ENABLED='0',
+        )
+        _setup_database(env)
+        script = os.path.abspath(__file__)
+
+        print(f'Startup, {args.runs} fresh interpreters per mode: median [min-max] sd')
+        timings = {label: {phase: [] for phase in PHASES} for label in STARTUP_MODES}
+        for _ in range(args.runs):
+            for label, (migrations, warm) in STARTUP_MODES.items():
+                output = subprocess.run(
+                    [sys.executable, script, '_startup', str(int(migrations)), str(int(warm))],
+                    env=env, cwd=REPO_DIR, check=True, capture_output=True, text=True,
+                ).stdout
+                for phase, value in json.loads(output).items():
+                    timings[label][phase].append(value)
+        for label in STARTUP_MODES:
+            print(f'  {label}')
+            for phase in PHASES:
+                if timings[label][phase]:
+                    print(f'    {phase:<14} {_summary(timings[label][phase])}')
+
+        print(f'\nPer-worker memory, {args.workers} workers x {args.requests * 3} requests')
+        for mode in ('per-worker', 'preload'):
+            output = subprocess.run(
+                [sys.executable, script, '_memory', mode, str(args.workers), str(args.requests)],
+                env=env, cwd=REPO_DIR, check=True, capture_output=True, text=True,
+            ).stdout
+            results = json.loads(output)
+            # A rejected listing never runs the code whose memory we are measuring
+            if any(result['failed'] for result in results):
+                sys.exit(f'{mode}: /users listing requests failed, memory figures are not meaningful')
+            rss = statistics.mean(result['rss'] for result in results) / 1024
+            uss = statistics.mean(result['uss'] for result in results) / 1024
+            print(f'  {mode:<12} RSS {rss:7.1f} MiB   USS (unshared) {uss:7.1f} MiB')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '_startup':
+        _startup_child(bool(int(sys.argv[2])), bool(int(sys.argv[3])))
+    elif len(sys.argv) > 1 and sys.argv[1] == '_memory':
+        _memory_child(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,66 @@
+"""Check that the admin user listing queries are served by indexes.
+
+    python check_query_plans.py
+
+Builds a throwaway SQLite database with the app's schema, runs EXPLAIN QUERY
+PLAN on each listing query and exits non-zero if a search scans the table or
+walks the primary key, or if any listing sorts in a temporary B-tree.
+"""
+import os
+import sys
+import tempfile
+
+CASES = [
+    # (label, user_listing_query kwargs, index the plan must use or None for the primary key)
+    ('all users', {}, None),
+    ('by role', {'role': 'writer'}, 'ix_user_role'),
+    ('username prefix', {'search_field': 'username', 'prefix': 'user12'}, 'sqlite_autoindex_user_1'),
+    ('username prefix, next page', {'search_field': 'username', 'prefix': 'user1', 'after': 'user150'}, 'sqlite_autoindex_user_1'),
+    ('email prefix', {'search_field': 'email', 'prefix': 'user12@'}, 'sqlite_autoindex_user_2'),
+    ('username prefix and role', {'search_field': 'username', 'prefix': 'user12', 'role': 'writer'}, 'sqlite_autoindex_user_1'),
+]
+
+
+def _plan(db, query):
+    compiled = query.limit(51).statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+        os.environ.setdefault('SECRET_KEY', 'plans')
+        os.environ.setdefault('JWT_SECRET_KEY', 'plans')
+
+        from app import create_app, user_listing_query
+        from models import db, User
+
+        app = create_app({'MIGRATIONS_ENABLED': False})
+        failures = 0
+        with app.app_context():
+            db.create_all()
+            roles = ['writer', 'client', 'admin']
+            db.session.execute(User.__table__.insert(), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com', '_password_hash': '-', 'role': roles[i % 3]}
+                for i in range(5000)
+            ])
+            db.session.commit()
+            db.session.execute(db.text('ANALYZE'))
+
+            for label, kwargs, index in CASES:
+                plan = _plan(db, user_listing_query(**kwargs))
+                joined = ' | '.join(plan)
+                ok = 'TEMP B-TREE' not in joined and not any(step.startswith('SCAN user') and 'INDEX' not in step for step in plan)
+                if index:
+                    ok = ok and f'INDEX {index}' in joined
+                else:
+                    ok = ok and 'INTEGER PRIMARY KEY' in joined
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {label:<28} {joined}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import os
+from datetime import timedelta
+from secrets import token_hex
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+    # Left unset to fall back on secrets persisted in the instance folder, see instance_secret()
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=1)
+
+    # Flask-Migrate pulls in Alembic, about a fifth of startup time. Only the
+    # `flask db` CLI needs it, so pre-fork web servers turn it off (see wsgi.py).
+    MIGRATIONS_ENABLED = True
+
+    NOTIFICATION_SINKS = os.environ.get('NOTIFICATION_SINKS', 'inbox,email,webhook').split(',')
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 1025))
+    NOTIFY_FROM = os.environ.get('NOTIFY_FROM', 'notifications@sharpquill.local')
+    NOTIFY_WEBHOOK_URL = os.environ.get('NOTIFY_WEBHOOK_URL')
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 4))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') not in ('0', 'false', 'no')
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE')  # Defaults to <instance>/ratelimit.db
+    # Endpoint group -> (requests, per_seconds), applied per client IP and per user
+    RATE_LIMITS = {
+        'login': (10, 60),
+        'bids': (30, 60),
+        'listing': (120, 60),
+    }
+    # Across all worker processes, for rate limited endpoints
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 32))
+
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER')  # Defaults to <instance>/uploads
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+
+
+def instance_secret(instance_path, name):
+    """Returns a secret stored in the instance folder, generating it on first use.
+
+    Every worker process reads the same file, so tokens signed by one worker
+    verify in all the others and survive restarts.
+    """
+    path = os.path.join(instance_path, name)
+    if not os.path.exists(path):
+        os.makedirs(instance_path, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(token_hex(32))
+        try:
+            # Atomic publish: if another process got there first, keep its secret
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(path) as f:
+        return f.read().strip()
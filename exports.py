@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import User, Assignment, Bid
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _export_spec(kind):
+    """Returns (columns, joins, date_column, status_column) for an export kind."""
+    if kind == 'users':
+        columns = [User.id, User.username, User.email, User.role]
+        return columns, [], None, User.role
+    if kind == 'assignments':
+        columns = [
+            Assignment.id, Assignment.title, Assignment.description, Assignment.price_tag,
+            Assignment.pages, Assignment.reference_style, Assignment.due_date,
+            Assignment.status, Assignment.user_id,
+        ]
+        return columns, [], Assignment.due_date, Assignment.status
+    if kind == 'bids':
+        columns = [
+            Bid.id, Bid.user_id, User.username.label('user'), Bid.assignment_id,
+            Assignment.title.label('assignment_title'), Bid.amount, Bid.status, Bid.created_at,
+        ]
+        joins = [(User, Bid.user_id == User.id), (Assignment, Bid.assignment_id == Assignment.id)]
+        return columns, joins, Bid.created_at, Bid.status
+    raise KeyError(kind)
+
+
+def build_export_query(kind, since=None, until=None, status=None):
+    """Build the select statement for an export. `until` is inclusive of the whole day."""
+    columns, joins, date_column, status_column = _export_spec(kind)
+    stmt = select(*columns)
+    for target, onclause in joins:
+        stmt = stmt.outerjoin(target, onclause)
+    if date_column is not None:
+        if since:
+            stmt = stmt.where(date_column >= since)
+        if until:
+            stmt = stmt.where(date_column < until + timedelta(days=1))
+    if status:
+        stmt = stmt.where(status_column == status)
+    order_column = columns[0]
+    return stmt.order_by(order_column).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def export_supports_dates(kind):
+    return _export_spec(kind)[2] is not None
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(rows, fieldnames):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_serialize(value) for value in row] for row in rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _encode_ndjson(rows, fieldnames):
+    lines = [
+        json.dumps({name: _serialize(value) for name, value in zip(fieldnames, row)})
+        for row in rows
+    ]
+    return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+
+
+def stream_export(result, fmt, compress=False):
+    """Yield encoded chunks one cursor batch at a time, optionally gzipped."""
+    fieldnames = list(result.keys())
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+    gzip = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    if fmt == 'csv':
+        # Emit the header even when the export is empty
+        chunk = _encode_csv([fieldnames], fieldnames)
+        yield gzip.compress(chunk) if gzip else chunk
+
+    for rows in result.partitions():
+        chunk = encode(rows, fieldnames)
+        if gzip:
+            chunk = gzip.compress(chunk)
+        if chunk:
+            yield chunk
+
+    result.close()
+    if gzip:
+        yield gzip.flush()
@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Import and warm the app once in the master so workers share its memory
+preload_app = True
+
+
+def post_fork(server, worker):
+    from models import db
+    from wsgi import app
+
+    # Drop any pooled connection inherited from the master without closing it
+    # under the master's feet; the worker opens its own on first use
+    with app.app_context():
+        db.engine.dispose(close=False)
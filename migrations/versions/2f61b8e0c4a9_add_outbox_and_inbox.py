@@ -0,0 +1,61 @@
+"""add notification outbox and inbox
+
+Revision ID: 2f61b8e0c4a9
+Revises: 9c2e4a7d1b3f
+Create Date: 2026-10-19 11:40:03.527918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f61b8e0c4a9'
+down_revision = '9c2e4a7d1b3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('recipient_id', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('delivered_sinks', sa.String(length=200), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('claim_token', sa.String(length=32), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['recipient_id'], ['user.id'], name=op.f('fk_outbox_events_recipient_id_user')),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outbox_events', schema=None) as batch_op:
+        batch_op.create_index('ix_outbox_events_status_available_at', ['status', 'available_at'], unique=False)
+
+    op.create_table('inbox_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('message', sa.String(length=255), nullable=False),
+    sa.Column('read', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_inbox_messages_user_id_user')),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('inbox_messages', schema=None) as batch_op:
+        batch_op.create_index('ix_inbox_messages_user_id', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inbox_messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_inbox_messages_user_id')
+
+    op.drop_table('inbox_messages')
+    with op.batch_alter_table('outbox_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_outbox_events_status_available_at')
+
+    op.drop_table('outbox_events')
@@ -0,0 +1,39 @@
+"""add user counts and role index
+
+Revision ID: 9c2e4a7d1b3f
+Revises: 4568cf08d835
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e4a7d1b3f'
+down_revision = '4568cf08d835'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_counts',
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('role')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_role', ['role'], unique=False)
+
+    # Backfill the counters from the existing users
+    op.execute(
+        'INSERT INTO user_counts (role, total) '
+        'SELECT role, COUNT(*) FROM "user" GROUP BY role'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_role')
+
+    op.drop_table('user_counts')
@@ -0,0 +1,46 @@
+"""add document analyses
+
+Revision ID: b7d3e915a2c6
+Revises: 2f61b8e0c4a9
+Create Date: 2026-10-19 14:05:27.640311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e915a2c6'
+down_revision = '2f61b8e0c4a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('document_analyses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('assignment_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('progress', sa.Integer(), nullable=False),
+    sa.Column('word_count', sa.Integer(), nullable=True),
+    sa.Column('page_estimate', sa.Integer(), nullable=True),
+    sa.Column('citation_style', sa.String(length=50), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('claim_token', sa.String(length=32), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['assignment_id'], ['assignment.id'], name=op.f('fk_document_analyses_assignment_id_assignment')),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('document_analyses', schema=None) as batch_op:
+        batch_op.create_index('ix_document_analyses_assignment_id', ['assignment_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document_analyses', schema=None) as batch_op:
+        batch_op.drop_index('ix_document_analyses_assignment_id')
+
+    op.drop_table('document_analyses')
@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, event, func
 from sqlalchemy.orm import validates
 from sqlalchemy_serializer import SerializerMixin
+import json
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -22,6 +23,7 @@ REFERENCE_STYLES = [ReferenceStyle.APA, ReferenceStyle.MLA, ReferenceStyle.CHICA
 
 class User(db.Model, SerializerMixin):
     __tablename__ = 'user'
+    __table_args__ = (db.Index('ix_user_role', 'role'),)
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -82,6 +84,49 @@ class User(db.Model, SerializerMixin):
             'role': self.role, 
         }
 
+
+class UserCount(db.Model):
+    """Running number of users per role, kept in step with the user table on flush."""
+    __tablename__ = 'user_counts'
+
+    role = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def total_for(cls, role=None):
+        """Returns the user count for a role, or for all roles when role is None."""
+        if role:
+            count = db.session.get(cls, role)
+            return count.total if count else 0
+        return db.session.query(func.coalesce(func.sum(cls.total), 0)).scalar()
+
+
+def _adjust_user_count(connection, role, delta):
+    table = UserCount.__table__
+    result = connection.execute(
+        table.update().where(table.c.role == role).values(total=table.c.total + delta)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(role=role, total=delta))
+
+
+@event.listens_for(User, 'after_insert')
+def _count_inserted_user(mapper, connection, target):
+    _adjust_user_count(connection, target.role, 1)
+
+
+@event.listens_for(User, 'after_delete')
+def _count_deleted_user(mapper, connection, target):
+    _adjust_user_count(connection, target.role, -1)
+
+
+@event.listens_for(User, 'after_update')
+def _count_role_change(mapper, connection, target):
+    history = db.inspect(target).attrs.role.history
+    if history.deleted and history.added:
+        _adjust_user_count(connection, history.deleted[0], -1)
+        _adjust_user_count(connection, history.added[0], 1)
+
 # Define valid reference styles for assignments
 REFERENCE_STYLES = ['APA', 'MLA', 'Chicago', 'Harvard']
 
@@ -221,3 +266,121 @@ class Bid(db.Model):
             'status': self.status,
             'created_at': self.created_at.isoformat()
         }
+
+
+class OutboxEvent(db.Model):
+    """A notification written in the same transaction as the change that caused it."""
+    __tablename__ = 'outbox_events'
+    __table_args__ = (db.Index('ix_outbox_events_status_available_at', 'status', 'available_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON encoded event details
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    delivered_sinks = db.Column(db.String(200), nullable=False, default='')  # Comma separated sink names
+    last_error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    recipient = db.relationship('User', lazy=True)
+
+    STATUS_OPTIONS = ['pending', 'processing', 'delivered', 'failed']
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} for User {self.recipient_id}>'
+
+    @classmethod
+    def enqueue(cls, event_type, recipient_id, **payload):
+        """Add an event to the current session; it is committed with the caller's changes."""
+        event = cls(event_type=event_type, recipient_id=recipient_id, payload=json.dumps(payload))
+        db.session.add(event)
+        return event
+
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
+    @property
+    def sinks_done(self):
+        return set(filter(None, self.delivered_sinks.split(',')))
+
+
+class InboxMessage(db.Model):
+    __tablename__ = 'inbox_messages'
+    __table_args__ = (db.Index('ix_inbox_messages_user_id', 'user_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+    read = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InboxMessage {self.id} for User {self.user_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'message': self.message,
+            'read': self.read,
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+class DocumentAnalysis(db.Model):
+    """Results of analysing a file uploaded against an assignment."""
+    __tablename__ = 'document_analyses'
+    __table_args__ = (db.Index('ix_document_analyses_assignment_id', 'assignment_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    progress = db.Column(db.Integer, nullable=False, default=0)  # Percent complete
+    word_count = db.Column(db.Integer)
+    page_estimate = db.Column(db.Integer)
+    citation_style = db.Column(db.String(50))  # One of REFERENCE_STYLES, or None if undetected
+    error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    assignment = db.relationship(
+        'Assignment', backref=db.backref('analyses', cascade='all, delete-orphan'), lazy=True
+    )
+
+    STATUS_OPTIONS = ['pending', 'processing', 'completed', 'failed']
+
+    def __repr__(self):
+        return f'<DocumentAnalysis {self.id} for Assignment {self.assignment_id}>'
+
+    def to_dict(self):
+        """Convert the analysis to a dictionary, comparing results with the assignment brief."""
+        pages_match = style_match = None
+        if self.status == 'completed' and self.assignment:
+            pages_match = self.page_estimate >= self.assignment.pages
+            if self.citation_style:
+                style_match = self.citation_style == self.assignment.reference_style
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'filename': self.filename,
+            'status': self.status,
+            'progress': self.progress,
+            'word_count': self.word_count,
+            'page_estimate': self.page_estimate,
+            'citation_style': self.citation_style,
+            'pages_match': pages_match,
+            'style_match': style_match,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+        }
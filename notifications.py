@@ -0,0 +1,218 @@
+import json
+import logging
+import smtplib
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from sqlalchemy import and_, or_, select, update
+
+from models import db, User, OutboxEvent, InboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Events claimed by a worker that has not finished them within the lease are retried
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 30
+
+SINKS = {}
+
+
+def sink(name):
+    """Register a delivery sink. A sink raises to signal that delivery should be retried."""
+    def wrapper(fn):
+        SINKS[name] = fn
+        return fn
+    return wrapper
+
+
+def describe(event):
+    """Human readable one-line summary of an outbox event."""
+    data = event.data
+    if event.event_type == 'bid_placed':
+        return f"{data['writer']} bid {data['amount']:.2f} on '{data['assignment_title']}'"
+    if event.event_type == 'assignment_status_changed':
+        return f"Assignment '{data['assignment_title']}' is now {data['status']}"
+    return event.event_type
+
+
+@sink('inbox')
+def deliver_inbox(app, event, recipient):
+    db.session.add(InboxMessage(
+        user_id=recipient.id,
+        event_type=event.event_type,
+        message=describe(event)[:255],
+    ))
+
+
+@sink('email')
+def deliver_email(app, event, recipient):
+    message = EmailMessage()
+    message['From'] = app.config['NOTIFY_FROM']
+    message['To'] = recipient.email
+    message['Subject'] = describe(event)
+    message.set_content(json.dumps(event.data, indent=2))
+    with smtplib.SMTP(app.config['SMTP_HOST'], app.config['SMTP_PORT'], timeout=10) as smtp:
+        smtp.send_message(message)
+
+
+@sink('webhook')
+def deliver_webhook(app, event, recipient):
+    url = app.config.get('NOTIFY_WEBHOOK_URL')
+    if not url:
+        return
+    body = json.dumps({
+        'id': event.id,
+        'event_type': event.event_type,
+        'recipient_id': recipient.id,
+        'payload': event.data,
+    }).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=10):
+        pass
+
+
+def claim_batch(batch_size):
+    """Atomically mark up to batch_size due events as ours and return them."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = or_(
+        and_(OutboxEvent.status == 'pending', OutboxEvent.available_at <= now),
+        and_(OutboxEvent.status == 'processing', OutboxEvent.claimed_at < now - CLAIM_LEASE),
+    )
+    ids = select(OutboxEvent.id).where(due).order_by(OutboxEvent.id).limit(batch_size)
+    db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(ids.scalar_subquery()), due)
+        .values(status='processing', claim_token=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return OutboxEvent.query.filter_by(claim_token=token).order_by(OutboxEvent.id).all()
+
+
+def _update_claimed(event_id, token, **values):
+    """Update an event only while we still hold its claim. Returns False if it was reclaimed."""
+    result = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event_id, OutboxEvent.claim_token == token)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def process_event(app, event):
+    # Read everything we need up front; the ORM copy goes stale after our own UPDATEs
+    event_id, token, attempts = event.id, event.claim_token, event.attempts
+    recipient = db.session.get(User, event.recipient_id)
+    done = event.sinks_done
+    error = None
+    if recipient:
+        for name in app.config['NOTIFICATION_SINKS']:
+            if name in done:
+                continue
+            # Renew the lease before each (possibly slow) delivery so the claim
+            # cannot expire while we are still working on the event
+            if not _update_claimed(event_id, token, claimed_at=datetime.utcnow()):
+                db.session.rollback()
+                logger.warning('Lost claim on outbox event %s; another worker has it', event_id)
+                return
+            db.session.commit()
+            try:
+                SINKS[name](app, event, recipient)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning('Sink %s failed for outbox event %s: %s', name, event_id, e)
+                error = f'{name}: {e}'
+                continue
+            done.add(name)
+            # Record each sink as it succeeds so a retry only repeats the failed ones
+            if not _update_claimed(event_id, token, delivered_sinks=','.join(sorted(done))):
+                db.session.rollback()
+                logger.warning('Lost claim on outbox event %s; another worker has it', event_id)
+                return
+            db.session.commit()
+    else:
+        error = 'Recipient no longer exists'
+
+    attempts += 1
+    values = {'attempts': attempts, 'claim_token': None, 'last_error': error}
+    if error is None:
+        values['status'] = 'delivered'
+    elif recipient is None or attempts >= MAX_ATTEMPTS:
+        values['status'] = 'failed'
+    else:
+        values['status'] = 'pending'
+        backoff = RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        values['available_at'] = datetime.utcnow() + timedelta(seconds=backoff)
+    if not _update_claimed(event_id, token, **values):
+        logger.warning('Lost claim on outbox event %s before recording its outcome', event_id)
+    db.session.commit()
+
+
+def drain_once(app, batch_size):
+    """Process one claimed batch. Returns the number of events handled."""
+    events = claim_batch(batch_size)
+    for event in events:
+        event_id = event.id
+        try:
+            process_event(app, event)
+        except Exception:
+            # Leave the event claimed; it is picked up again once the lease expires
+            logger.exception('Failed to process outbox event %s', event_id)
+            db.session.rollback()
+    return len(events)
+
+
+def _worker_loop(app, batch_size, poll_interval, stop):
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                handled = drain_once(app, batch_size)
+            except Exception:
+                logger.exception('Outbox worker failed to claim a batch')
+                handled = 0
+            finally:
+                db.session.remove()
+        if not handled:
+            stop.wait(poll_interval)
+
+
+def run_workers(app, num_workers=4, batch_size=50, poll_interval=1.0, stop=None):
+    """Drain the outbox with a pool of worker threads until stop is set."""
+    stop = stop or threading.Event()
+    threads = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(app, batch_size, poll_interval, stop),
+            name=f'outbox-worker-{i}',
+            daemon=True,
+        )
+        for i in range(num_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        stop.set()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app({'MIGRATIONS_ENABLED': False})
+    logging.basicConfig(level=logging.INFO)
+    run_workers(
+        app,
+        num_workers=app.config['OUTBOX_WORKERS'],
+        batch_size=app.config['OUTBOX_BATCH_SIZE'],
+    )
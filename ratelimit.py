@@ -0,0 +1,215 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)',
+    # A pid alone can be reused by a new worker once the old one dies, so rows are
+    # keyed by pid and process start time
+    'CREATE TABLE IF NOT EXISTS inflight_requests ('
+    'pid INTEGER NOT NULL, started INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (pid, started))',
+)
+
+# Roughly one call in this many also deletes buckets that have refilled completely
+PURGE_EVERY = 1000
+RELEASE_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _process_start(pid):
+    """Start time of a process in clock ticks since boot, or 0 where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Field 22; the command name in field 2 may itself contain spaces and parentheses
+            return int(f.read().rsplit(')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class LimiterStore:
+    """Token buckets and in-flight request counts in a SQLite file shared by all workers.
+
+    Each process (and thread) opens its own connection, so the store is safe to
+    create before the server forks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Limiter state is disposable, so skip fsync on every request
+            conn.execute('PRAGMA synchronous=OFF')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.process = (self._local.pid, _process_start(self._local.pid))
+        return self._local.conn
+
+    def take(self, group, keys, rate, capacity):
+        """Take one token from every bucket in keys, all or nothing.
+
+        Keys all start with '<group>:'; rate and capacity are that group's limits.
+
+        Returns 0 when allowed, otherwise the seconds until a token is available.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = {}
+            for key in keys:
+                row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                levels[key] = tokens
+            lowest = min(levels.values())
+            if lowest < 1:
+                conn.execute('ROLLBACK')
+                return (1 - lowest) / rate
+            conn.executemany(
+                'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                [(key, tokens - 1, now) for key, tokens in levels.items()],
+            )
+            self._calls += 1
+            if self._calls % PURGE_EVERY == 0:
+                # Groups refill at different rates, so only purge buckets governed by ours
+                conn.execute(
+                    'DELETE FROM buckets WHERE key >= ? AND key < ? AND updated < ?',
+                    (f'{group}:', f'{group};', now - capacity / rate),
+                )
+            conn.execute('COMMIT')
+            return 0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire_slot(self, limit):
+        """Count this request as in flight unless `limit` requests already are."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            total = conn.execute('SELECT COALESCE(SUM(count), 0) FROM inflight_requests').fetchone()[0]
+            if total >= limit:
+                # Workers that died mid-request never released their slots
+                total -= self._purge_dead_workers(conn)
+            if total >= limit:
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute(
+                'INSERT INTO inflight_requests (pid, started, count) VALUES (?, ?, 1) '
+                'ON CONFLICT(pid, started) DO UPDATE SET count = count + 1',
+                self._local.process,
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release_slot(self):
+        """Give back a slot taken by acquire_slot.
+
+        Runs after the response is built, so a busy database must not turn a
+        served request into an error: retry briefly, then log and move on.
+        """
+        for attempt in range(RELEASE_ATTEMPTS):
+            try:
+                self._connection().execute(
+                    'UPDATE inflight_requests SET count = count - 1 WHERE pid = ? AND started = ?',
+                    self._local.process,
+                )
+                return
+            except sqlite3.OperationalError:
+                if attempt == RELEASE_ATTEMPTS - 1:
+                    logger.exception('Could not release rate limiter slot for pid %s', os.getpid())
+                else:
+                    time.sleep(0.05 * (attempt + 1))
+
+    def _purge_dead_workers(self, conn):
+        freed = 0
+        for pid, started, count in conn.execute('SELECT pid, started, count FROM inflight_requests').fetchall():
+            try:
+                os.kill(pid, 0)
+                alive = True
+            except ProcessLookupError:
+                alive = False
+            except PermissionError:
+                alive = True
+            if alive and started:
+                # The pid may now belong to a different process
+                alive = _process_start(pid) == started
+            if not alive:
+                conn.execute('DELETE FROM inflight_requests WHERE pid = ? AND started = ?', (pid, started))
+                freed += count
+        return freed
+
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _jwt_user():
+    verify_jwt_in_request(optional=True)
+    identity = get_jwt_identity()
+    return identity['user_id'] if identity else None
+
+
+def login_attempt_key():
+    """Key for the login limiter: the attempted username from this client only, so
+    guessing from one address slows down without anyone else locking the account out."""
+    username = request.form.get('username')
+    return f'{_client_ip()}:{username}' if username else None
+
+
+def rate_limit(name, user_key=_jwt_user):
+    """Admission control for a view: per-IP and per-user token buckets plus a global
+    cap on concurrent requests. `user_key` returns what identifies the user, if anything.
+
+    Limits come from RATE_LIMITS[name] as (requests, per_seconds).
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorated_function(*args, **kwargs):
+            config = current_app.config
+            if not config['RATELIMIT_ENABLED']:
+                return fn(*args, **kwargs)
+            store = current_app.extensions['ratelimit']
+
+            requests, per_seconds = config['RATE_LIMITS'][name]
+            keys = [f'{name}:ip:{_client_ip()}']
+            user = user_key()
+            if user is not None:
+                keys.append(f'{name}:user:{user}')
+            retry_after = store.take(name, keys, requests / per_seconds, requests)
+            if retry_after:
+                return {"message": "Too many requests, slow down"}, 429, {'Retry-After': str(math.ceil(retry_after))}
+
+            if not store.acquire_slot(config['MAX_CONCURRENT_REQUESTS']):
+                return {"message": "Server busy, try again shortly"}, 503, {'Retry-After': '1'}
+            try:
+                rv = fn(*args, **kwargs)
+            except BaseException:
+                store.release_slot()
+                raise
+            if isinstance(rv, Response) and rv.is_streamed:
+                # The body is generated after we return; hold the slot until it is sent
+                rv.call_on_close(store.release_slot)
+            else:
+                store.release_slot()
+            return rv
+        return decorated_function
+    return wrapper
@@ -1,8 +1,9 @@
-from app import app
+from app import create_app
 from models import db, User, Assignment, Bid
 from datetime import datetime
 
 def seed_data():
+    app = create_app()
     with app.app_context():
         # Drop existing tables and create new ones
         db.drop_all()
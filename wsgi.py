@@ -0,0 +1,8 @@
+"""Entry point for pre-fork servers: gunicorn -c gunicorn.conf.py
+
+The app is built and warmed once in the master; workers inherit it on fork.
+"""
+from app import create_app, warm_up
+
+app = create_app({'MIGRATIONS_ENABLED': False})
+warm_up(app)